@@ -1,13 +1,16 @@
 import streamlit as st
 import pandas as pd
-import io
 import os
+import hashlib
 from utils import (
+    ler_csv_bytes,
     adaptar_csv_biblioteca,
     criar_dj_set,
     plotar_curva_de_vibe,
+    plotar_sobreposicao_de_sets,
     exportar_set_csv
 )
+from config import MAX_SETS_COMPARACAO
 
 # --- CONFIGURAÇÃO DA PÁGINA E ESTADO INICIAL ---
 st.set_page_config(
@@ -28,6 +31,15 @@ if 'df_set_gerado' not in st.session_state:
     st.session_state.df_set_gerado = None
 if 'csv_para_download' not in st.session_state:
     st.session_state.csv_para_download = ""
+if 'historico_sets' not in st.session_state:
+    # Lista de (nome, curva, DataFrame) dos sets gerados, usada no gráfico de comparação
+    st.session_state.historico_sets = []
+if 'contador_sets' not in st.session_state:
+    # Só aumenta, para os nomes na comparação não se repetirem quando o histórico é podado
+    st.session_state.contador_sets = 0
+if 'hash_arquivo_carregado' not in st.session_state:
+    # Hash do último CSV enviado; o bloco de upload roda em todo rerun e só deve resetar o estado se o arquivo mudar
+    st.session_state.hash_arquivo_carregado = None
 
 # --- CABEÇALHO PRINCIPAL ---
 st.title("🎧 DJ Set Creator")
@@ -55,6 +67,7 @@ with st.sidebar:
                 # Reseta qualquer estado antigo
                 st.session_state.df_set_gerado = None
                 st.session_state.csv_para_download = ""
+                st.session_state.historico_sets = []
         except Exception as e:
             st.error(f"Erro ao carregar arquivo de exemplo: {e}")
             st.session_state.biblioteca_limpa = None
@@ -75,20 +88,16 @@ with st.sidebar:
 
 
     # Processamento do arquivo de upload
-    if uploaded_file is not None:
+    hash_arquivo = hashlib.sha1(uploaded_file.getvalue()).hexdigest() if uploaded_file is not None else None
+    if uploaded_file is not None and hash_arquivo != st.session_state.hash_arquivo_carregado:
+        st.session_state.hash_arquivo_carregado = hash_arquivo
         try:
             # `st.spinner` mostra uma mensagem de "carregando" enquanto o bloco é executado.
             with st.spinner('Processando e limpando sua biblioteca...'):
-                df_real = None
             # Usamos getvalue() para ler em memória e permitir múltiplas leituras
                 file_bytes = uploaded_file.getvalue()
-            
-                try:
-                    # Tentativa 1: UTF-8
-                    df_real = pd.read_csv(io.BytesIO(file_bytes), encoding='utf-8')
-                except (UnicodeDecodeError, KeyError):
-                    # Tentativa 2 (Fallback): latin-1
-                    df_real = pd.read_csv(io.BytesIO(file_bytes), encoding='latin-1')
+                # Tenta UTF-8 e, se falhar, latin-1
+                df_real = ler_csv_bytes(file_bytes)
                 if df_real is None:
                     raise ValueError("Não foi possível ler o arquivo CSV com os encodings suportados.")
                 
@@ -97,6 +106,7 @@ with st.sidebar:
             # Reseta qualquer set antigo se uma nova biblioteca for carregada
             st.session_state.df_set_gerado = None
             st.session_state.csv_para_download = ""
+            st.session_state.historico_sets = []
         except Exception as e:
             st.error(f"Erro ao processar o arquivo: {e}")
             st.session_state.biblioteca_limpa = None
@@ -119,21 +129,45 @@ with st.sidebar:
         peso_key = 1.0 - peso_bpm
         st.slider("Mixagem Harmônica (prioriza KEYs iguais)", value=peso_key, disabled=True, width=340)
 
+        with st.expander("Restrições do Set"):
+            espacamento_artista = st.slider("Espaçamento mínimo entre faixas do mesmo artista", min_value=0, max_value=10, value=0, step=1, width=340)
+            max_por_artista = st.number_input("Máximo de faixas por artista (0 = sem limite)", min_value=0, max_value=100, value=0, step=1)
+            max_drift_bpm = st.number_input("Variação máxima de BPM dentro de cada segmento (0 = sem limite)", min_value=0, max_value=60, value=0, step=1)
+            musicas_obrigatorias = st.multiselect("Músicas obrigatórias", options=df_limpo['title'].tolist())
+            musicas_proibidas = st.multiselect("Músicas proibidas", options=df_limpo['title'].tolist())
+        restricoes = {
+            'espacamento_artista': int(espacamento_artista),
+            'max_por_artista': int(max_por_artista) or None,
+            'obrigatorias': musicas_obrigatorias,
+            'proibidas': musicas_proibidas,
+            'max_drift_bpm_segmento': int(max_drift_bpm) or None
+        }
+
         # Botão de Ação para gerar o set
         if st.button("▶️ Criar DJ Set!", width="stretch"):
             with st.spinner(f'Criando DJ Set {set_name}'):
                 musica_inicial_final = None if musica_inicial == "Automático" else musica_inicial
                 
                 # Executa a lógica principal e atualiza o estado da sessão
-                df_set_gerado = criar_dj_set(
-                    biblioteca=df_limpo,
-                    tamanho_set=int(tamanho_set),
-                    curva_energia_str=curva_str,
-                    musica_inicial_nome=musica_inicial_final,
-                    bpm_tolerancia=int(bpm_tolerancia),
-                    pesos={'bpm': peso_bpm, 'key': peso_key}
-                )
+                try:
+                    df_set_gerado = criar_dj_set(
+                        biblioteca=df_limpo,
+                        tamanho_set=int(tamanho_set),
+                        curva_energia_str=curva_str,
+                        musica_inicial_nome=musica_inicial_final,
+                        bpm_tolerancia=int(bpm_tolerancia),
+                        pesos={'bpm': peso_bpm, 'key': peso_key},
+                        restricoes=restricoes
+                    )
+                except ValueError as e:
+                    # Ex: a mesma música marcada como obrigatória e proibida
+                    st.error(f"Restrições inválidas: {e}")
+                    df_set_gerado = pd.DataFrame()
                 st.session_state.df_set_gerado = df_set_gerado
+                if not df_set_gerado.empty:
+                    st.session_state.contador_sets += 1
+                    st.session_state.historico_sets.append((f"#{st.session_state.contador_sets} {set_name}", curva_str, df_set_gerado))
+                    st.session_state.historico_sets = st.session_state.historico_sets[-MAX_SETS_COMPARACAO:]
                 
                 # Prepara os dados para download IMEDIATAMENTE e salva no estado
                 if not df_set_gerado.empty:
@@ -174,15 +208,31 @@ if st.session_state.df_set_gerado is not None and not st.session_state.df_set_ge
     st.success(f"✅ DJ Set:  **{set_name}**  foi criado com sucesso!")
     
     st.subheader("📊 Visualização da Vibe")
-    fig = plotar_curva_de_vibe(st.session_state.df_set_gerado)
+    # A figura vem do cache (não deve ser modificada), então o título é passado na criação
+    fig = plotar_curva_de_vibe(st.session_state.df_set_gerado, titulo=f'<b>Curva de Vibe: {set_name}</b>')
     config = {
         'toImageButtonOptions': {
         'format': 'png', # one of png, svg, jpeg, webp
         'filename': set_name,
         }
     }
-    fig.update_layout(title={'text': f'<b>Curva de Vibe: {set_name}</b>'})
     st.plotly_chart(fig, use_container_width=True, config=config)
+
+    # Comparação de todas as variações geradas nesta sessão em um único gráfico WebGL
+    historico = st.session_state.historico_sets
+    if len(historico) > 1:
+        with st.expander(f"📈 Comparar os {len(historico)} sets gerados"):
+            curvas = {curva for _, curva, _ in historico}
+            fig_comparacao = plotar_sobreposicao_de_sets(
+                [df for _, _, df in historico],
+                # As faixas alvo só fazem sentido se todos os sets usaram a mesma curva
+                curva_energia_str=curvas.pop() if len(curvas) == 1 else None,
+                nomes=[nome for nome, _, _ in historico]
+            )
+            st.plotly_chart(fig_comparacao, use_container_width=True)
+            if st.button("Limpar comparação"):
+                st.session_state.historico_sets = []
+                st.rerun()
     
     st.subheader(f"🎶 Set List: {set_name}")
     st.dataframe(st.session_state.df_set_gerado[['title', 'artist', 'bpm', 'key', 'vibe', 'transition_name', 'transition_effect', 'transition_icon', 'transition_score']])
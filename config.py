@@ -21,4 +21,44 @@ VIBE_SEGMENTS = {
     'up': (0.7, 1.0)
 }
 
-DEFAULT_PESOS = {'bpm': 0.6, 'key': 0.4}
\ No newline at end of file
+DEFAULT_PESOS = {'bpm': 0.6, 'key': 0.4}
+
+# Número máximo de figuras Plotly mantidas em memória pelo cache de gráficos.
+MAX_FIGURAS_EM_CACHE = 32
+
+# Cores de fundo das faixas de vibe no gráfico de sobreposição de sets.
+CORES_SEGMENTOS = {
+    'down': 'rgba(99, 110, 250, 0.12)',
+    'mid': 'rgba(0, 204, 150, 0.12)',
+    'up': 'rgba(239, 85, 59, 0.12)'
+}
+
+# Configurações do serviço HTTP local de geração de sets (servidor.py).
+SERVIDOR_HOST = '127.0.0.1'
+SERVIDOR_PORTA = 8765
+SERVIDOR_MAX_WORKERS = 4          # Tamanho do pool de geração
+SERVIDOR_MAX_FILA = 64            # Gerações aguardando um worker antes de recusar (HTTP 503)
+SERVIDOR_TIMEOUT_GERACAO = 120    # Segundos que uma requisição espera pelo resultado
+SERVIDOR_JANELA_LATENCIAS = 1000  # Quantidade de latências recentes usadas nos percentis
+
+# Restrições opcionais aplicadas por `criar_dj_set` (veja `ControleRestricoes` em utils.py).
+# Nos limites numéricos, 0 e None significam "sem limite".
+DEFAULT_RESTRICOES = {
+    'espacamento_artista': 0,        # Mínimo de músicas entre duas faixas do mesmo artista (0 = sem espaçamento)
+    'max_por_artista': None,         # Máximo de faixas de um mesmo artista no set (0/None = sem limite)
+    'obrigatorias': [],              # Títulos que precisam entrar no set
+    'proibidas': [],                 # Títulos que nunca entram no set
+    'max_drift_bpm_segmento': None   # Variação máxima de BPM em relação à 1ª faixa de cada segmento (0/None = sem limite)
+}
+
+# Separadores usados para dividir colaborações ("A/B", "A & B", "A feat. B", "A Featuring B")
+# em artistas individuais. Sem diferenciar maiúsculas e só com palavras inteiras.
+SEPARADORES_ARTISTA = r'(?i)\s*(?:/|,|;|&|\b(?:feat(?:uring)?|ft)\b\.?)\s*'
+
+# Bibliotecas divididas por crate (pasta pai em 'localização'), veja crates.py.
+CRATE_PADRAO = 'Sem crate'      # Crate atribuída quando o caminho não tem pasta
+SHARDS_MAX_WORKERS = 4          # Threads usadas para consultar as crates em paralelo
+SHARDS_TOP_K = 5                # Melhores candidatas devolvidas por crate em cada passo
+
+# Quantidade máxima de sets guardados na sessão para o gráfico de comparação do app.
+MAX_SETS_COMPARACAO = 50
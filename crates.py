@@ -0,0 +1,394 @@
+"""Bibliotecas grandes divididas em shards por crate, com busca paralela de candidatas.
+
+Cada crate (a pasta pai em 'localização', ex: "Amapiano-afrobeat-kuduro") vira um
+`ShardCrate` com as músicas ordenadas por BPM e as colunas já convertidas em arrays
+NumPy. A cada passo do set, cada shard localiza sua janela de tolerância de BPM por
+busca binária e pontua só essas músicas de forma vetorizada; as crates são
+consultadas em paralelo e as melhores candidatas de cada uma são unidas. Assim o
+custo do passo acompanha a maior janela de tolerância, e não o tamanho da coleção.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import CRATE_PADRAO, DEFAULT_RESTRICOES, SHARDS_MAX_WORKERS, SHARDS_TOP_K
+from utils import ControleRestricoes, IndiceArtistas, analisar_transicao_com_vibe, get_target_vibe_range
+
+COLUNAS_SHARD = ['title', 'artist', 'bpm', 'key', 'localização']
+
+
+def extrair_crate(localizacoes):
+    """Extrai o nome da crate (pasta pai do arquivo) de cada caminho.
+
+    Args:
+        localizacoes (pd.Series): A coluna 'localização' da biblioteca.
+
+    Returns:
+        pd.Series: O nome da crate de cada música (`CRATE_PADRAO` se não houver pasta).
+    """
+    partes = localizacoes.astype(str).str.replace('\\', '/', regex=False).str.rsplit('/', n=2)
+    crates = partes.str[-2].where(partes.str.len() > 1)
+    return crates.fillna(CRATE_PADRAO).replace('', CRATE_PADRAO)
+
+
+def pontuar_candidatas(bpm_anterior, num_anterior, b_anterior, bpm, num, b, vibe, segmento_alvo, pesos, bpm_tolerancia):
+    """Versão vetorizada de `calculate_final_score` + `calculate_energy_curve_bonus`.
+
+    Args:
+        bpm_anterior (float): BPM da música anterior.
+        num_anterior (int): Número Camelot da música anterior (0 se inválido).
+        b_anterior (bool): True se a chave anterior é do modo 'B'.
+        bpm, num, b, vibe (np.ndarray): Arrays das candidatas (num == 0 indica chave inválida).
+        segmento_alvo (str): O segmento da curva de vibe atual.
+        pesos (dict): Pesos de 'bpm' e 'key'.
+        bpm_tolerancia (float): Tolerância de BPM.
+
+    Returns:
+        np.ndarray: O score final de cada candidata.
+    """
+    # Score de BPM: decaimento linear até a tolerância
+    diff = np.abs(bpm - bpm_anterior)
+    score_bpm = np.where(diff > bpm_tolerancia, 0.0, 1.0 - diff / bpm_tolerancia)
+    # Score de chave: mesmas regras de `calculate_key_score_programmatic`
+    jump = (num - num_anterior + 12) % 12
+    flip = b != b_anterior
+    distancia_salto = np.minimum(jump, 12 - jump)
+    penalidade_flip = np.where(flip, np.where(jump != 0, 0.05, 0.02), 0.0)
+    score_key = np.maximum(0, 1.0 - ((distancia_salto ** 1.5) * 0.05 + penalidade_flip))
+    if num_anterior == 0:
+        score_key = np.zeros_like(score_key)
+    score_key = np.where(num == 0, 0.0, score_key)
+    # Bônus da curva de energia
+    min_vibe, max_vibe = get_target_vibe_range(segmento_alvo)
+    distancia_do_alvo = np.maximum(min_vibe - vibe, 0) + np.maximum(vibe - max_vibe, 0)
+    bonus = np.where(distancia_do_alvo == 0, 0.20, np.maximum(-0.5, -distancia_do_alvo))
+    return (pesos['bpm'] * score_bpm) + (pesos['key'] * score_key) + bonus
+
+
+class ShardCrate:
+    """Índice de uma crate: músicas ordenadas por BPM e colunas em arrays NumPy.
+
+    Args:
+        nome (str): O nome da crate.
+        biblioteca (pd.DataFrame): As músicas da crate, já adaptadas por `adaptar_csv_biblioteca`.
+        offset (int): Posição global da primeira música deste shard.
+        codigos_titulo (np.ndarray): Código inteiro global do título de cada música,
+                                     na mesma ordem de `biblioteca`.
+    """
+
+    def __init__(self, nome, biblioteca, offset, codigos_titulo):
+        ordem = np.argsort(biblioteca['bpm'].to_numpy(dtype=float), kind='stable')
+        self.nome = nome
+        self.df = biblioteca[COLUNAS_SHARD].iloc[ordem].reset_index(drop=True)
+        self.offset = offset
+        self.posicoes = np.arange(offset, offset + len(self.df))
+        self.codigos_titulo = codigos_titulo[ordem]
+        self.bpm = self.df['bpm'].to_numpy(dtype=float)
+        chaves = self.df['key'].astype(str).str.extract(r'^(\d{1,2})([AB])$')
+        numeros = pd.to_numeric(chaves[0], errors='coerce').fillna(0).astype(int).to_numpy()
+        self.num = np.where((numeros >= 1) & (numeros <= 12), numeros, 0)
+        self.b = (chaves[1] == 'B').to_numpy()
+        self.key_factor = np.where(self.df['key'].astype(str).str.contains('B', regex=False), 1.0, 0.85)
+        self.bpm_norm = None  # Definido por `BibliotecaSharded` com o min/max global
+
+    def __len__(self):
+        return len(self.df)
+
+    def calcular_vibe(self, pesos, fatia=slice(None)):
+        """Mesma fórmula de `utils.calcular_vibe`, só para a fatia pedida."""
+        return (pesos['bpm'] * self.bpm_norm[fatia]) + (pesos['key'] * self.key_factor[fatia])
+
+    def melhores_candidatas(self, anterior, segmento_alvo, pesos, bpm_tolerancia, titulos_usados,
+                            controle=None, pendentes=None, ignorar_regras=False, top_k=SHARDS_TOP_K):
+        """Pontua as músicas da janela de BPM e devolve as `top_k` melhores.
+
+        Args:
+            anterior (dict): A música anterior, com 'bpm', '_num' e '_b'.
+            segmento_alvo (str): O segmento da curva de vibe atual.
+            pesos (dict): Pesos de 'bpm' e 'key'.
+            bpm_tolerancia (float): Tolerância de BPM.
+            titulos_usados (np.ndarray): Máscara global de títulos já usados no set.
+            controle (ControleRestricoes, optional): Restrições ativas.
+            pendentes (np.ndarray, optional): Códigos das obrigatórias pendentes. Se
+                                              informado, só elas são consideradas.
+            ignorar_regras (bool): Com `pendentes`, ignora a janela de BPM e as
+                                   restrições (o último recurso de `criar_dj_set`).
+            top_k (int): Quantas candidatas devolver.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Scores e posições globais, do melhor para o pior.
+        """
+        if ignorar_regras:
+            janela = slice(None)
+        else:
+            # Busca binária da janela de tolerância (inclusiva nas duas pontas)
+            inicio = np.searchsorted(self.bpm, anterior['bpm'] - bpm_tolerancia, side='left')
+            fim = np.searchsorted(self.bpm, anterior['bpm'] + bpm_tolerancia, side='right')
+            janela = slice(inicio, fim)
+        validas = ~titulos_usados[self.codigos_titulo[janela]]
+        if pendentes is not None:
+            validas &= np.isin(self.codigos_titulo[janela], pendentes)
+        if controle and not ignorar_regras:
+            validas &= controle.permitida(self.posicoes[janela])
+        indices = np.flatnonzero(validas) + (janela.start or 0)
+        if not indices.size:
+            return np.empty(0), np.empty(0, dtype=int)
+        scores = pontuar_candidatas(
+            anterior['bpm'], anterior['_num'], anterior['_b'],
+            self.bpm[indices], self.num[indices], self.b[indices], self.calcular_vibe(pesos, indices),
+            segmento_alvo, pesos, bpm_tolerancia
+        )
+        if indices.size > top_k:
+            melhores = np.argpartition(-scores, top_k - 1)[:top_k]
+            scores, indices = scores[melhores], indices[melhores]
+        # Ordena por score e, em empate, pela posição global (a ordem de `criar_dj_set`)
+        ordem = np.lexsort((self.posicoes[indices], -scores))
+        return scores[ordem], self.posicoes[indices[ordem]]
+
+
+class BibliotecaSharded:
+    """Uma biblioteca dividida em shards (`ShardCrate`) consultados em paralelo.
+
+    Args:
+        crates (dict[str, pd.DataFrame]): Músicas de cada crate, já adaptadas.
+        max_workers (int, optional): Threads usadas para consultar os shards.
+    """
+
+    def __init__(self, crates, max_workers=SHARDS_MAX_WORKERS):
+        crates = {nome: df for nome, df in crates.items() if not df.empty}
+        if not crates:
+            raise ValueError("Nenhuma crate com músicas válidas.")
+        # Códigos de título globais: títulos iguais em crates diferentes contam como a mesma música
+        titulos = pd.concat([df['title'] for df in crates.values()], ignore_index=True)
+        codigos_titulo, self._titulos = pd.factorize(titulos)
+        # O pandas monta a tabela hash do Index no primeiro `get_loc`; montamos aqui, e não na 1ª geração
+        self._titulos.get_loc(self._titulos[0])
+        self.shards = []
+        offset = 0
+        for nome, df in crates.items():
+            self.shards.append(ShardCrate(nome, df, offset, codigos_titulo[offset:offset + len(df)]))
+            offset += len(df)
+        self._offsets = np.array([shard.offset for shard in self.shards])
+        # Normalização de BPM com o min/max da coleção inteira, como em `calcular_vibe`
+        min_bpm = min(shard.bpm[0] for shard in self.shards)
+        max_bpm = max(shard.bpm[-1] for shard in self.shards)
+        for shard in self.shards:
+            shard.bpm_norm = (shard.bpm - min_bpm) / (max_bpm - min_bpm)
+        # Arrays usados pelas restrições, montados uma única vez e alinhados às posições globais.
+        # Não guardamos uma cópia das colunas: os títulos ficam como códigos e o BPM como array.
+        self._bpm_global = np.concatenate([shard.bpm for shard in self.shards])
+        self._codigos_titulo_global = np.concatenate([shard.codigos_titulo for shard in self.shards])
+        self._indice_artistas = IndiceArtistas(pd.concat([shard.df['artist'] for shard in self.shards], ignore_index=True))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crate')
+
+    @classmethod
+    def de_biblioteca(cls, biblioteca, **kwargs):
+        """Divide uma biblioteca adaptada em crates pela coluna 'localização'."""
+        crates = dict(tuple(biblioteca.groupby(extrair_crate(biblioteca['localização']), sort=True)))
+        return cls(crates, **kwargs)
+
+    @property
+    def crates(self):
+        return [shard.nome for shard in self.shards]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def _shard_da_posicao(self, posicao):
+        shard = self.shards[np.searchsorted(self._offsets, posicao, side='right') - 1]
+        return shard, posicao - shard.offset
+
+    def musica(self, posicao, pesos):
+        """Retorna o dicionário de uma música a partir da posição global."""
+        shard, local = self._shard_da_posicao(posicao)
+        musica = shard.df.iloc[local].to_dict()
+        musica['vibe'] = float(shard.calcular_vibe(pesos, local))
+        musica['_pos'] = int(posicao)
+        musica['_num'] = int(shard.num[local])
+        musica['_b'] = bool(shard.b[local])
+        return musica
+
+    def selecionar_shards(self, crates_incluidas=None, crates_excluidas=None):
+        """Filtra os shards pelo nome da crate."""
+        return [
+            shard for shard in self.shards
+            if (not crates_incluidas or shard.nome in crates_incluidas)
+            and shard.nome not in (crates_excluidas or [])
+        ]
+
+    def controle_restricoes(self, restricoes):
+        """Cria um `ControleRestricoes` alinhado às posições globais dos shards.
+
+        Reaproveita o índice de artistas da biblioteca; só os contadores são novos.
+        """
+        regras = {**DEFAULT_RESTRICOES, **(restricoes or {})}
+        codigos_proibidos = self._titulos.get_indexer(list(regras['proibidas']))
+        codigos_proibidos = codigos_proibidos[codigos_proibidos >= 0]
+        posicoes_proibidas = np.flatnonzero(np.isin(self._codigos_titulo_global, codigos_proibidos)) if codigos_proibidos.size else np.empty(0, dtype=int)
+        obrigatorias_encontradas = {titulo for titulo in regras['obrigatorias'] if titulo in self._titulos}
+        return ControleRestricoes(self._bpm_global, self._indice_artistas, restricoes,
+                                  posicoes_proibidas, obrigatorias_encontradas)
+
+    def codigo_titulo(self, titulo):
+        """Retorna o código global de um título."""
+        return self._titulos.get_loc(titulo)
+
+    def consultar(self, shards, *args, **kwargs):
+        """Consulta os shards em paralelo e une as melhores candidatas.
+
+        Returns:
+            tuple[float, int] or None: O melhor score e sua posição global, ou None.
+        """
+        futuros = [self._executor.submit(shard.melhores_candidatas, *args, **kwargs) for shard in shards]
+        resultados = [futuro.result() for futuro in futuros]
+        scores = np.concatenate([scores for scores, _ in resultados])
+        if not scores.size:
+            return None
+        posicoes = np.concatenate([posicoes for _, posicoes in resultados])
+        melhor = np.lexsort((posicoes, -scores))[0]
+        return float(scores[melhor]), int(posicoes[melhor])
+
+    def encerrar(self):
+        self._executor.shutdown(wait=False)
+
+
+def criar_dj_set_sharded(biblioteca, tamanho_set, curva_energia_str, musica_inicial_nome=None, bpm_tolerancia=8,
+                         pesos={'bpm': 0.6, 'key': 0.4}, restricoes=None, crates_incluidas=None, crates_excluidas=None):
+    """Gera um DJ set como `criar_dj_set`, mas sobre uma `BibliotecaSharded`.
+
+    Args:
+        biblioteca (BibliotecaSharded): A biblioteca dividida em crates.
+        tamanho_set (int): O número de músicas desejado no set final.
+        curva_energia_str (str): A jornada de vibe, separada por hífens (ex: "mid-up-up-down").
+        musica_inicial_nome (str, optional): Título da música de abertura. Defaults to None.
+        bpm_tolerancia (int, optional): A tolerância máxima de BPM. Defaults to 8.
+        pesos (dict, optional): Pesos de 'bpm' e 'key'. Defaults to {'bpm': 0.6, 'key': 0.4}.
+        restricoes (dict, optional): Restrições no formato de `DEFAULT_RESTRICOES`. Defaults to None.
+        crates_incluidas (list[str], optional): Se informado, só estas crates são usadas.
+        crates_excluidas (list[str], optional): Crates que nunca são usadas.
+
+    Returns:
+        pd.DataFrame: O set gerado, com as mesmas colunas de `criar_dj_set`.
+    """
+    print("="*50)
+    print(f"INICIANDO GERAÇÃO DE SET SHARDED - CURVA: {curva_energia_str}")
+    print("="*50)
+
+    # 1. PREPARAÇÃO
+    colunas_finais = ['title', 'artist', 'bpm', 'key', 'localização', 'vibe', 'transition_name', 'transition_effect', 'transition_icon', 'transition_score']
+    curva_energia_lista = curva_energia_str.split('-')
+    if not curva_energia_lista or not curva_energia_lista[0]:
+        print("Erro: String de curva de energia inválida.")
+        return pd.DataFrame(columns=colunas_finais)
+    shards = biblioteca.selecionar_shards(crates_incluidas, crates_excluidas)
+    if not shards:
+        print("Erro: Nenhuma crate selecionada.")
+        return pd.DataFrame(columns=colunas_finais)
+    if tamanho_set < len(curva_energia_lista):
+        print("Erro: O tamanho do set precisa ter pelo menos uma música por segmento da curva.")
+        return pd.DataFrame(columns=colunas_finais)
+    print(f"Crates consultadas: {[shard.nome for shard in shards]}")
+    tamanho_segmento = tamanho_set // len(curva_energia_lista)
+    controle = biblioteca.controle_restricoes(restricoes) if restricoes else None
+    titulos_usados = np.zeros(len(biblioteca._titulos), dtype=bool)
+    if controle and controle.obrigatorias_pendentes:
+        # Obrigatórias que só existem em crates fora do filtro nunca poderiam entrar
+        codigos_pendentes = np.array([biblioteca.codigo_titulo(titulo) for titulo in controle.obrigatorias_pendentes])
+        alcancaveis = np.zeros(codigos_pendentes.size, dtype=bool)
+        for shard in shards:
+            alcancaveis |= np.isin(codigos_pendentes, shard.codigos_titulo)
+        fora_do_filtro = {biblioteca._titulos[codigo] for codigo in codigos_pendentes[~alcancaveis]}
+        if fora_do_filtro:
+            print(f"Aviso: músicas obrigatórias fora das crates selecionadas: {sorted(fora_do_filtro)}")
+            controle.obrigatorias_pendentes -= fora_do_filtro
+
+    # 2. SELEÇÃO DA PRIMEIRA MÚSICA (a de menor vibe dentro do primeiro segmento)
+    posicao_inicial = None
+    for shard in shards:
+        if musica_inicial_nome is None:
+            break
+        encontradas = np.flatnonzero(shard.df['title'].to_numpy() == musica_inicial_nome)
+        if encontradas.size and (controle is None or controle.permitida(shard.posicoes[encontradas[:1]])[0]):
+            posicao_inicial = int(shard.posicoes[encontradas[0]])
+            break
+    if posicao_inicial is None:
+        min_vibe, max_vibe = get_target_vibe_range(curva_energia_lista[0])
+        melhor_na_faixa, melhor_geral = None, None
+        for shard in shards:
+            vibes = shard.calcular_vibe(pesos)
+            permitidas = controle.permitida(shard.posicoes) if controle else np.ones(len(shard), dtype=bool)
+            for candidatas, atual in ((permitidas & (vibes >= min_vibe) & (vibes <= max_vibe), 'faixa'), (permitidas, 'geral')):
+                indices = np.flatnonzero(candidatas)
+                if not indices.size:
+                    continue
+                local = indices[np.argmin(vibes[indices])]
+                opcao = (vibes[local], int(shard.posicoes[local]))
+                if atual == 'faixa':
+                    melhor_na_faixa = min(melhor_na_faixa or opcao, opcao)
+                else:
+                    melhor_geral = min(melhor_geral or opcao, opcao)
+        if melhor_geral is None:
+            print("Erro: Nenhuma música disponível nas crates selecionadas.")
+            return pd.DataFrame(columns=colunas_finais)
+        if melhor_na_faixa is None:
+            print(f"Aviso: Nenhuma música encontrada na faixa de vibe inicial '{curva_energia_lista[0]}'. Iniciando com a de menor vibe geral.")
+        posicao_inicial = (melhor_na_faixa or melhor_geral)[1]
+
+    musica_atual_dict = biblioteca.musica(posicao_inicial, pesos)
+    musica_atual_dict['transition_name'] = 'Abertura'
+    musica_atual_dict['transition_effect'] = 'Início do Set'
+    musica_atual_dict['transition_icon'] = '🎉'
+    musica_atual_dict['transition_score'] = 1.0
+    setlist = [musica_atual_dict]
+    titulos_usados[biblioteca.codigo_titulo(musica_atual_dict['title'])] = True
+    if controle:
+        controle.obrigatorias_pendentes.discard(musica_atual_dict['title'])
+        controle.iniciar_passo(0, 0)
+        controle.registrar(posicao_inicial, 0, 0)
+
+    # 3. LOOP PRINCIPAL: cada passo consulta as crates em paralelo
+    while len(setlist) < tamanho_set:
+        musica_anterior = setlist[-1]
+        posicao_atual = len(setlist)
+        indice_segmento = min(posicao_atual // tamanho_segmento, len(curva_energia_lista) - 1)
+        segmento_alvo = curva_energia_lista[indice_segmento]
+        args_consulta = (shards, musica_anterior, segmento_alvo, pesos, bpm_tolerancia, titulos_usados)
+        melhor = None
+        pendentes = None
+        forcar_obrigatorias = False
+        if controle:
+            controle.iniciar_passo(posicao_atual, indice_segmento)
+            if controle.obrigatorias_pendentes:
+                # Obrigatórias pendentes que passam nas regras e na tolerância têm prioridade
+                pendentes = np.array([biblioteca.codigo_titulo(titulo) for titulo in controle.obrigatorias_pendentes])
+                melhor = biblioteca.consultar(*args_consulta, controle=controle, pendentes=pendentes)
+                forcar_obrigatorias = len(controle.obrigatorias_pendentes) >= tamanho_set - posicao_atual
+        if melhor is None and not forcar_obrigatorias:
+            melhor = biblioteca.consultar(*args_consulta, controle=controle)
+        if melhor is None and pendentes is not None:
+            # Último recurso (só restam as vagas das obrigatórias ou nada passa nas regras):
+            # as obrigatórias entram ignorando as regras e a tolerância de BPM
+            if not forcar_obrigatorias:
+                print("Aviso: nenhuma candidata passa nas restrições; usando as músicas obrigatórias pendentes.")
+            melhor = biblioteca.consultar(*args_consulta, controle=controle, pendentes=pendentes, ignorar_regras=True)
+        if melhor is None:
+            print(f"Não encontrei nenhuma música compatível para continuar o set após '{musica_anterior['title']}'. Parando.")
+            break
+
+        score_final, posicao = melhor
+        proxima_musica_dict = biblioteca.musica(posicao, pesos)
+        analise = analisar_transicao_com_vibe(musica_anterior['key'], proxima_musica_dict['key'])
+        proxima_musica_dict['transition_name'] = analise['nome_funcao']
+        proxima_musica_dict['transition_effect'] = analise.get('efeito_base')
+        proxima_musica_dict['transition_icon'] = analise['icon']
+        proxima_musica_dict['transition_score'] = score_final
+        setlist.append(proxima_musica_dict)
+        titulos_usados[biblioteca.codigo_titulo(proxima_musica_dict['title'])] = True
+        if controle:
+            controle.obrigatorias_pendentes.discard(proxima_musica_dict['title'])
+            controle.registrar(posicao, posicao_atual, indice_segmento)
+
+    if controle and controle.obrigatorias_pendentes:
+        print(f"Aviso: músicas obrigatórias que não entraram no set: {sorted(controle.obrigatorias_pendentes)}")
+    return pd.DataFrame(setlist)[colunas_finais]
@@ -0,0 +1,307 @@
+"""Serviço HTTP/JSON local para gerar DJ sets sem passar pelo Streamlit.
+
+Endpoints:
+    POST /bibliotecas   Corpo: o CSV exportado do software de DJ. Retorna {"id": ...}.
+    POST /sets          Corpo JSON: {"biblioteca_id", "tamanho_set", "curva_energia",
+                        "pesos", "bpm_tolerancia", "musica_inicial", "restricoes"}.
+                        Retorna o set.
+    GET  /metricas      Profundidade da fila, workers ocupados e percentis de latência.
+
+Uso:
+    python servidor.py --porta 8765 --workers 4
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    DEFAULT_PESOS,
+    DEFAULT_RESTRICOES,
+    SERVIDOR_HOST,
+    SERVIDOR_PORTA,
+    SERVIDOR_MAX_WORKERS,
+    SERVIDOR_MAX_FILA,
+    SERVIDOR_TIMEOUT_GERACAO,
+    SERVIDOR_JANELA_LATENCIAS
+)
+from utils import ler_csv_bytes, adaptar_csv_biblioteca, criar_dj_set, calcular_hash_set
+
+# Tipos aceitos em cada chave de 'restricoes' (espelham `DEFAULT_RESTRICOES`)
+RESTRICOES_NUMERICAS = ('espacamento_artista', 'max_por_artista', 'max_drift_bpm_segmento')
+RESTRICOES_LISTAS = ('obrigatorias', 'proibidas')
+
+
+class RequisicaoInvalida(ValueError):
+    """Parâmetros de geração ausentes ou inválidos (HTTP 400)."""
+
+
+class BibliotecaNaoEncontrada(KeyError):
+    """O `biblioteca_id` informado não foi carregado (HTTP 404)."""
+
+
+class FilaCheia(RuntimeError):
+    """O pool de geração atingiu `max_fila` gerações aguardando (HTTP 503)."""
+
+
+class ServicoGeracao:
+    """Guarda as bibliotecas carregadas e executa as gerações em um pool limitado.
+
+    Requisições idênticas (mesma biblioteca, tamanho, curva, pesos, tolerância,
+    música de abertura e restrições) que chegam enquanto uma geração está em andamento
+    aguardam o mesmo `Future` em vez de disparar uma nova computação.
+
+    Args:
+        max_workers (int): Número de threads de geração.
+        max_fila (int): Máximo de gerações aguardando um worker livre.
+        janela_latencias (int): Quantidade de latências recentes mantidas para os percentis.
+    """
+
+    def __init__(self, max_workers=SERVIDOR_MAX_WORKERS, max_fila=SERVIDOR_MAX_FILA,
+                 janela_latencias=SERVIDOR_JANELA_LATENCIAS):
+        self.max_fila = max_fila
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='geracao')
+        self._lock = threading.Lock()
+        self._bibliotecas = {}
+        self._em_andamento = {}
+        self._latencias = deque(maxlen=janela_latencias)
+        self._fila = 0
+        self._executando = 0
+        self._total_requisicoes = 0
+        self._total_coalescidas = 0
+        self._total_geracoes = 0
+        self._total_erros = 0
+
+    # --- BIBLIOTECAS ---
+    def carregar_biblioteca(self, file_bytes):
+        """Adapta um CSV bruto e o registra. O ID é o hash da biblioteca limpa,
+        então enviar o mesmo arquivo duas vezes retorna o mesmo ID."""
+        try:
+            biblioteca = adaptar_csv_biblioteca(ler_csv_bytes(file_bytes))
+        except KeyError as e:
+            # Colunas essenciais ausentes no CSV são erro do cliente
+            raise RequisicaoInvalida(e.args[0] if e.args else str(e))
+        except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+            raise RequisicaoInvalida(f"CSV vazio ou malformado: {e}")
+        if biblioteca.empty:
+            raise RequisicaoInvalida("A biblioteca não possui nenhuma música válida.")
+        biblioteca_id = calcular_hash_set(biblioteca)
+        with self._lock:
+            self._bibliotecas.setdefault(biblioteca_id, biblioteca)
+        return biblioteca_id, len(biblioteca)
+
+    # --- GERAÇÃO ---
+    def _normalizar_parametros(self, corpo):
+        """Valida o corpo JSON de /sets e retorna uma tupla hashable (chave de coalescência)."""
+        if not isinstance(corpo, dict):
+            raise RequisicaoInvalida("O corpo deve ser um objeto JSON.")
+        biblioteca_id = corpo.get('biblioteca_id')
+        if not isinstance(biblioteca_id, str):
+            raise RequisicaoInvalida("'biblioteca_id' deve ser uma string.")
+        if biblioteca_id not in self._bibliotecas:
+            raise BibliotecaNaoEncontrada(f"Biblioteca '{biblioteca_id}' não encontrada.")
+        curva = corpo.get('curva_energia')
+        if not isinstance(curva, str) or not curva.split('-')[0]:
+            raise RequisicaoInvalida("'curva_energia' deve ser uma string como 'mid-up-down'.")
+        pesos = corpo.get('pesos', DEFAULT_PESOS)
+        try:
+            tamanho_set = int(corpo.get('tamanho_set', 20))
+            bpm_tolerancia = int(corpo.get('bpm_tolerancia', 8))
+            peso_bpm, peso_key = float(pesos['bpm']), float(pesos['key'])
+        except (TypeError, ValueError, KeyError):
+            raise RequisicaoInvalida("'tamanho_set', 'bpm_tolerancia' e 'pesos' ({'bpm', 'key'}) devem ser numéricos.")
+        if tamanho_set < 1 or bpm_tolerancia < 1:
+            raise RequisicaoInvalida("'tamanho_set' e 'bpm_tolerancia' devem ser maiores que zero.")
+        if tamanho_set < len(curva.split('-')):
+            raise RequisicaoInvalida("'tamanho_set' deve ter pelo menos uma música por segmento de 'curva_energia'.")
+        musica_inicial = corpo.get('musica_inicial') or None
+        if musica_inicial is not None and not isinstance(musica_inicial, str):
+            raise RequisicaoInvalida("'musica_inicial' deve ser uma string ou null.")
+        restricoes = self._normalizar_restricoes(corpo.get('restricoes') or {})
+        return (biblioteca_id, tamanho_set, curva, peso_bpm, peso_key, bpm_tolerancia, musica_inicial, restricoes)
+
+    def _normalizar_restricoes(self, restricoes):
+        """Valida 'restricoes' e a converte em uma tupla ordenada (hashable e estável)."""
+        if not isinstance(restricoes, dict) or set(restricoes) - set(DEFAULT_RESTRICOES):
+            raise RequisicaoInvalida(f"'restricoes' aceita apenas as chaves {sorted(DEFAULT_RESTRICOES)}.")
+        normalizadas = []
+        for nome, valor in restricoes.items():
+            if nome in RESTRICOES_NUMERICAS:
+                if valor is not None and (isinstance(valor, bool) or not isinstance(valor, int) or valor < 0):
+                    raise RequisicaoInvalida(f"'restricoes.{nome}' deve ser um inteiro não negativo ou null.")
+            elif nome in RESTRICOES_LISTAS:
+                if not isinstance(valor, list) or not all(isinstance(titulo, str) for titulo in valor):
+                    raise RequisicaoInvalida(f"'restricoes.{nome}' deve ser uma lista de títulos (strings).")
+                valor = tuple(sorted(set(valor)))
+            normalizadas.append((nome, valor))
+        conflitos = set(restricoes.get('obrigatorias', [])) & set(restricoes.get('proibidas', []))
+        if conflitos:
+            raise RequisicaoInvalida(f"Músicas obrigatórias e proibidas ao mesmo tempo: {sorted(conflitos)}")
+        return tuple(sorted(normalizadas))
+
+    def _executar(self, chave):
+        """Roda `criar_dj_set` em um worker e devolve a resposta já serializada."""
+        biblioteca_id, tamanho_set, curva, peso_bpm, peso_key, bpm_tolerancia, musica_inicial, restricoes = chave
+        with self._lock:
+            self._fila -= 1
+            self._executando += 1
+        try:
+            df_set = criar_dj_set(
+                biblioteca=self._bibliotecas[biblioteca_id],
+                tamanho_set=tamanho_set,
+                curva_energia_str=curva,
+                musica_inicial_nome=musica_inicial,
+                bpm_tolerancia=bpm_tolerancia,
+                pesos={'bpm': peso_bpm, 'key': peso_key},
+                restricoes={nome: list(valor) if isinstance(valor, tuple) else valor for nome, valor in restricoes}
+            )
+            # Serializa uma única vez; todas as requisições coalescidas recebem os mesmos bytes
+            resposta = {'tamanho': len(df_set), 'set': json.loads(df_set.to_json(orient='records', force_ascii=False))}
+            return json.dumps(resposta, ensure_ascii=False).encode('utf-8')
+        finally:
+            with self._lock:
+                self._executando -= 1
+                self._total_geracoes += 1
+                self._em_andamento.pop(chave, None)
+
+    def gerar_set(self, corpo, timeout=SERVIDOR_TIMEOUT_GERACAO):
+        """Gera (ou aguarda a geração idêntica em andamento) e retorna o JSON em bytes."""
+        inicio = time.perf_counter()
+        chave = self._normalizar_parametros(corpo)
+        with self._lock:
+            self._total_requisicoes += 1
+            futuro = self._em_andamento.get(chave)
+            if futuro is not None:
+                self._total_coalescidas += 1
+            else:
+                if self._fila >= self.max_fila:
+                    raise FilaCheia(f"Fila de geração cheia ({self.max_fila} aguardando).")
+                self._fila += 1
+                futuro = self._executor.submit(self._executar, chave)
+                self._em_andamento[chave] = futuro
+        try:
+            return futuro.result(timeout=timeout)
+        except Exception:
+            with self._lock:
+                self._total_erros += 1
+            raise
+        finally:
+            with self._lock:
+                self._latencias.append((time.perf_counter() - inicio) * 1000)
+
+    # --- MÉTRICAS ---
+    def metricas(self):
+        """Retorna um snapshot das métricas do serviço."""
+        with self._lock:
+            latencias = np.array(self._latencias)
+            metricas = {
+                'fila': self._fila,
+                'executando': self._executando,
+                'max_workers': self.max_workers,
+                'max_fila': self.max_fila,
+                'bibliotecas': len(self._bibliotecas),
+                'requisicoes': self._total_requisicoes,
+                'coalescidas': self._total_coalescidas,
+                'geracoes': self._total_geracoes,
+                'erros': self._total_erros
+            }
+        if latencias.size:
+            p50, p90, p99 = np.percentile(latencias, [50, 90, 99])
+            metricas['latencia_ms'] = {'p50': round(p50, 1), 'p90': round(p90, 1), 'p99': round(p99, 1),
+                                       'amostras': int(latencias.size)}
+        else:
+            metricas['latencia_ms'] = None
+        return metricas
+
+    def encerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def criar_handler(servico):
+    """Cria a classe de handler HTTP ligada a uma instância de `ServicoGeracao`."""
+
+    class HandlerGeracao(BaseHTTPRequestHandler):
+
+        def _responder(self, status, corpo):
+            dados = corpo if isinstance(corpo, bytes) else json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def _ler_corpo(self):
+            tamanho = int(self.headers.get('Content-Length', 0))
+            return self.rfile.read(tamanho)
+
+        def do_GET(self):
+            if self.path == '/metricas':
+                self._responder(200, servico.metricas())
+            else:
+                self._responder(404, {'erro': f"Rota '{self.path}' não encontrada."})
+
+        def do_POST(self):
+            try:
+                if self.path == '/bibliotecas':
+                    biblioteca_id, total = servico.carregar_biblioteca(self._ler_corpo())
+                    self._responder(201, {'id': biblioteca_id, 'musicas': total})
+                elif self.path == '/sets':
+                    try:
+                        corpo = json.loads(self._ler_corpo() or b'{}')
+                    except json.JSONDecodeError as e:
+                        raise RequisicaoInvalida(f"JSON inválido: {e}")
+                    self._responder(200, servico.gerar_set(corpo))
+                else:
+                    self._responder(404, {'erro': f"Rota '{self.path}' não encontrada."})
+            except BibliotecaNaoEncontrada as e:
+                self._responder(404, {'erro': e.args[0]})
+            except RequisicaoInvalida as e:
+                self._responder(400, {'erro': str(e)})
+            except FilaCheia as e:
+                self._responder(503, {'erro': str(e)})
+            except FuturesTimeoutError:
+                self._responder(504, {'erro': 'Tempo limite de geração excedido.'})
+            except Exception as e:
+                self._responder(500, {'erro': f"Erro interno: {e}"})
+
+    return HandlerGeracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de geração de DJ sets.")
+    parser.add_argument('--host', default=SERVIDOR_HOST)
+    parser.add_argument('--porta', type=int, default=SERVIDOR_PORTA)
+    parser.add_argument('--workers', type=int, default=SERVIDOR_MAX_WORKERS)
+    parser.add_argument('--max-fila', type=int, default=SERVIDOR_MAX_FILA)
+    args = parser.parse_args()
+
+    servico = ServicoGeracao(max_workers=args.workers, max_fila=args.max_fila)
+    servidor = ThreadingHTTPServer((args.host, args.porta), criar_handler(servico), bind_and_activate=False)
+    # O backlog padrão do socket (5) derruba conexões em rajadas; acompanha o tamanho da fila
+    servidor.request_queue_size = max(args.max_fila, servidor.request_queue_size)
+    try:
+        servidor.server_bind()
+        servidor.server_activate()
+    except OSError:
+        servidor.server_close()
+        servico.encerrar()
+        raise
+    print(f"Servidor de geração ouvindo em http://{args.host}:{args.porta} ({args.workers} workers)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servico.encerrar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Teste de carga do serviço de geração (servidor.py), rodando só em localhost.
+
+Sobe o servidor em um subprocesso, carrega a biblioteca de exemplo e dispara
+requisições concorrentes. Parte delas é repetida de propósito para exercitar a
+coalescência de requisições idênticas.
+
+Uso:
+    python teste_carga.py --requisicoes 200 --concorrencia 32 --variacoes 8
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+CURVAS = ['up-mid-down-up', 'mid-up-up-down', 'down-mid-up', 'up-down-mid']
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def requisitar(url, dados=None, content_type='application/json'):
+    """Faz uma requisição e retorna (status, corpo JSON)."""
+    requisicao = urllib.request.Request(url, data=dados, headers={'Content-Type': content_type})
+    try:
+        with urllib.request.urlopen(requisicao, timeout=300) as resposta:
+            return resposta.status, json.loads(resposta.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def aguardar_servidor(base_url, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            requisitar(f"{base_url}/metricas")
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError("O servidor não respondeu a tempo.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga local do servidor de geração.")
+    parser.add_argument('--requisicoes', type=int, default=100)
+    parser.add_argument('--concorrencia', type=int, default=16)
+    parser.add_argument('--variacoes', type=int, default=8, help="Quantidade de combinações de parâmetros distintas.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--tamanho-set', type=int, default=20)
+    args = parser.parse_args()
+
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    porta = porta_livre()
+    base_url = f"http://127.0.0.1:{porta}"
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(diretorio, 'servidor.py'), '--host', '127.0.0.1',
+         '--porta', str(porta), '--workers', str(args.workers), '--max-fila', str(args.requisicoes)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        aguardar_servidor(base_url)
+        with open(os.path.join(diretorio, 'assets', 'sample_library.csv'), 'rb') as f:
+            status, corpo = requisitar(f"{base_url}/bibliotecas", f.read(), 'text/csv')
+        if status != 201:
+            raise RuntimeError(f"Falha ao carregar a biblioteca: {corpo}")
+        biblioteca_id = corpo['id']
+        print(f"Biblioteca carregada: {corpo['musicas']} músicas (id {biblioteca_id[:12]}...)")
+
+        # Combinações distintas de parâmetros; as requisições repetem essas variações
+        variacoes = []
+        for i in range(args.variacoes):
+            peso_bpm = round(0.4 + 0.05 * (i // len(CURVAS)), 2)
+            variacoes.append({
+                'biblioteca_id': biblioteca_id,
+                'tamanho_set': args.tamanho_set,
+                'curva_energia': CURVAS[i % len(CURVAS)],
+                'pesos': {'bpm': peso_bpm, 'key': round(1.0 - peso_bpm, 2)},
+                'bpm_tolerancia': 8
+            })
+
+        def disparar(i):
+            corpo = json.dumps(variacoes[i % len(variacoes)]).encode('utf-8')
+            inicio = time.perf_counter()
+            status, _ = requisitar(f"{base_url}/sets", corpo)
+            return status, (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concorrencia) as pool:
+            resultados = list(pool.map(disparar, range(args.requisicoes)))
+        duracao = time.perf_counter() - inicio
+
+        latencias = np.array([lat for _, lat in resultados])
+        status_contagem = {}
+        for status, _ in resultados:
+            status_contagem[status] = status_contagem.get(status, 0) + 1
+        p50, p90, p99 = np.percentile(latencias, [50, 90, 99])
+        print(f"{args.requisicoes} requisições em {duracao:.2f}s ({args.requisicoes / duracao:.1f} req/s)")
+        print(f"Status: {status_contagem}")
+        print(f"Latência no cliente (ms): p50={p50:.1f} p90={p90:.1f} p99={p99:.1f}")
+        _, metricas = requisitar(f"{base_url}/metricas")
+        print(f"Métricas do servidor: {json.dumps(metricas, ensure_ascii=False)}")
+    finally:
+        processo.terminate()
+        processo.wait()
+
+
+if __name__ == '__main__':
+    main()
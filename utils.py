@@ -1,9 +1,36 @@
 import pandas as pd
+import numpy as np
+import io
 import re
+import hashlib
+import threading
+from collections import OrderedDict, deque
 import plotly.graph_objects as go
 import plotly.express as px
-from config import (CONFIG_SALTOS, VIBE_SEGMENTS, DEFAULT_PESOS)
+from config import (CONFIG_SALTOS, VIBE_SEGMENTS, DEFAULT_PESOS, MAX_FIGURAS_EM_CACHE, CORES_SEGMENTOS,
+                    DEFAULT_RESTRICOES, SEPARADORES_ARTISTA)
 
+# Cache LRU de figuras já construídas, indexado pelo hash do conteúdo do(s) set(s).
+# O Streamlit roda cada sessão em sua própria thread, então o acesso é protegido por um lock.
+_cache_figuras = OrderedDict()
+_lock_cache_figuras = threading.Lock()
+
+
+def ler_csv_bytes(file_bytes):
+    """Lê o conteúdo bruto de um CSV, tentando UTF-8 e depois latin-1.
+
+    Args:
+        file_bytes (bytes): O conteúdo do arquivo CSV.
+
+    Returns:
+        pd.DataFrame: O DataFrame bruto, ainda não adaptado.
+    """
+    try:
+        # Tentativa 1: UTF-8
+        return pd.read_csv(io.BytesIO(file_bytes), encoding='utf-8')
+    except (UnicodeDecodeError, KeyError):
+        # Tentativa 2 (Fallback): latin-1
+        return pd.read_csv(io.BytesIO(file_bytes), encoding='latin-1')
 
 def adaptar_csv_biblioteca(df_original):
     """Adapta um DataFrame de biblioteca musical para o formato padrão do sistema.
@@ -280,7 +307,156 @@ def calculate_final_score(musica_anterior, candidata, pesos={'bpm': 0.7, 'key':
       'analise_transicao': analise_key
   }
 
-def criar_dj_set(biblioteca, tamanho_set, curva_energia_str, musica_inicial_nome=None, bpm_tolerancia=8, pesos={'bpm': 0.6, 'key': 0.4}):
+class IndiceArtistas:
+    """Índice CSR entre faixas e códigos inteiros de artista.
+
+    Colaborações como "A/B" contam para A e para B. O índice só depende da
+    biblioteca, então pode ser montado uma vez e reutilizado por várias gerações.
+
+    Args:
+        artistas (pd.Series): A coluna 'artist', na ordem das posições das faixas.
+    """
+
+    def __init__(self, artistas):
+        n_faixas = len(artistas)
+        artistas = artistas.astype(str).reset_index(drop=True)
+        artistas = artistas.str.split(SEPARADORES_ARTISTA, regex=True).explode().str.strip().str.lower()
+        artistas = artistas[artistas != '']
+        faixas = artistas.index.to_numpy()
+        codigos, nomes = pd.factorize(artistas)
+        self.n_faixas = n_faixas
+        self.n_artistas = len(nomes)
+        # `explode` mantém a ordem das faixas, então os pares já estão agrupados por faixa
+        self._artistas_por_faixa = codigos
+        self._inicio_faixa = np.searchsorted(faixas, np.arange(n_faixas + 1))
+        ordem = np.argsort(codigos, kind='stable')
+        self._faixas_por_artista = faixas[ordem]
+        self._inicio_artista = np.searchsorted(codigos[ordem], np.arange(self.n_artistas + 1))
+
+    def artistas_da_faixa(self, posicao):
+        return self._artistas_por_faixa[self._inicio_faixa[posicao]:self._inicio_faixa[posicao + 1]]
+
+    def faixas_do_artista(self, codigo):
+        return self._faixas_por_artista[self._inicio_artista[codigo]:self._inicio_artista[codigo + 1]]
+
+
+class ControleRestricoes:
+    """Aplica as restrições do set com contadores incrementais sobre códigos inteiros.
+
+    Cada artista recebe um código inteiro (colaborações como "A/B" contam para
+    A e para B) e cada faixa da biblioteca tem um contador de bloqueios. Uma
+    faixa só é candidata enquanto seu contador for zero. Escolher uma faixa só
+    mexe nos contadores das faixas dos artistas dela, então o custo por passo
+    não depende do tamanho da biblioteca. O drift de BPM é recalculado apenas
+    quando um novo segmento começa.
+
+    Regras:
+    - `espacamento_artista`: após tocar um artista, as próximas N posições não
+      podem ter faixas dele.
+    - `max_por_artista`: ao atingir o limite, todas as faixas do artista saem.
+    - `proibidas`: títulos bloqueados desde o início.
+    - `obrigatorias`: a cada passo, as pendentes que passam nas regras e na
+      tolerância de BPM têm prioridade. Como último recurso (restam tantas
+      vagas quanto pendentes, ou nenhuma outra música passa nas regras), o set
+      escolhe só entre elas, ignorando as demais regras e a tolerância.
+    - `max_drift_bpm_segmento`: dentro de um segmento da curva, o BPM não se
+      afasta mais que N da primeira faixa do segmento.
+
+    Em `max_por_artista` e `max_drift_bpm_segmento`, 0 e None significam sem limite.
+
+    Para um DataFrame, use `ControleRestricoes.de_biblioteca`. O construtor recebe
+    apenas arrays, para bibliotecas que não cabem em um único DataFrame (crates.py).
+
+    Args:
+        bpm (np.ndarray): O BPM de cada faixa, indexado pela posição.
+        indice (IndiceArtistas): Índice de artistas alinhado às mesmas posições.
+        restricoes (dict): Dicionário no formato de `DEFAULT_RESTRICOES`.
+        posicoes_proibidas (np.ndarray): Posições das faixas com títulos proibidos.
+        obrigatorias_encontradas (set[str]): Títulos obrigatórios que existem na biblioteca.
+
+    Raises:
+        ValueError: Se algum título estiver em `obrigatorias` e em `proibidas`.
+    """
+
+    def __init__(self, bpm, indice, restricoes, posicoes_proibidas, obrigatorias_encontradas):
+        regras = {**DEFAULT_RESTRICOES, **(restricoes or {})}
+        conflitos = set(regras['obrigatorias']) & set(regras['proibidas'])
+        if conflitos:
+            raise ValueError(f"Músicas marcadas como obrigatórias e proibidas ao mesmo tempo: {sorted(conflitos)}")
+        self.espacamento = int(regras['espacamento_artista'] or 0)
+        self.max_por_artista = int(regras['max_por_artista']) if regras['max_por_artista'] else None
+        self.max_drift = regras['max_drift_bpm_segmento'] or None
+        self.bpm = bpm
+
+        # 1. Códigos inteiros de artista em formato CSR (faixa -> artistas e artista -> faixas)
+        self.indice = indice
+
+        # 2. Contadores de estado
+        self._bloqueios = np.zeros(len(bpm), dtype=np.int32)
+        self._contagem_artista = np.zeros(self.indice.n_artistas, dtype=np.int32)
+        self._liberacoes = deque()  # (posição do set em que libera, código do artista), em ordem crescente
+        self._fora_do_drift = None
+        self._segmento_atual = None
+
+        # 3. Proibidas ficam bloqueadas desde o início; obrigatórias viram pendências
+        self._bloqueios[posicoes_proibidas] += 1
+        self.obrigatorias_pendentes = set(obrigatorias_encontradas)
+        faltando = set(regras['obrigatorias']) - self.obrigatorias_pendentes
+        if faltando:
+            print(f"Aviso: músicas obrigatórias não encontradas na biblioteca: {sorted(faltando)}")
+
+    @classmethod
+    def de_biblioteca(cls, biblioteca, restricoes):
+        """Cria o controle para uma biblioteca em DataFrame (posições = ordem das linhas)."""
+        regras = {**DEFAULT_RESTRICOES, **(restricoes or {})}
+        titulos = biblioteca['title']
+        posicoes_proibidas = np.flatnonzero(titulos.isin(regras['proibidas']).to_numpy()) if regras['proibidas'] else np.empty(0, dtype=int)
+        obrigatorias_encontradas = set(titulos[titulos.isin(regras['obrigatorias'])]) if regras['obrigatorias'] else set()
+        return cls(biblioteca['bpm'].to_numpy(dtype=float), IndiceArtistas(biblioteca['artist']), restricoes,
+                   posicoes_proibidas, obrigatorias_encontradas)
+
+    def permitida(self, posicoes):
+        """Retorna a máscara booleana das posições (coluna '_pos') ainda permitidas."""
+        return self._bloqueios[posicoes] == 0
+
+    def iniciar_passo(self, posicao_set, indice_segmento):
+        """Libera os espaçamentos vencidos e, se o segmento mudou, remove o drift do anterior."""
+        while self._liberacoes and self._liberacoes[0][0] <= posicao_set:
+            _, codigo = self._liberacoes.popleft()
+            self._bloqueios[self.indice.faixas_do_artista(codigo)] -= 1
+        if indice_segmento != self._segmento_atual and self._fora_do_drift is not None:
+            self._bloqueios[self._fora_do_drift] -= 1
+            self._fora_do_drift = None
+
+    def registrar(self, posicao_faixa, posicao_set, indice_segmento):
+        """Atualiza os contadores após a faixa `posicao_faixa` entrar na posição `posicao_set`."""
+        for codigo in self.indice.artistas_da_faixa(posicao_faixa):
+            faixas_artista = self.indice.faixas_do_artista(codigo)
+            self._contagem_artista[codigo] += 1
+            if self.espacamento > 0:
+                self._bloqueios[faixas_artista] += 1
+                self._liberacoes.append((posicao_set + self.espacamento + 1, codigo))
+            if self.max_por_artista and self._contagem_artista[codigo] == self.max_por_artista:
+                self._bloqueios[faixas_artista] += 1  # Bloqueio permanente
+        # A primeira faixa de cada segmento vira a âncora do drift de BPM
+        if indice_segmento != self._segmento_atual:
+            self._segmento_atual = indice_segmento
+            if self.max_drift is not None:
+                self._fora_do_drift = np.flatnonzero(np.abs(self.bpm - self.bpm[posicao_faixa]) > self.max_drift)
+                self._bloqueios[self._fora_do_drift] += 1
+
+def _avaliar_candidatas(musica_anterior, candidatas, segmento_alvo, pesos, bpm_tolerancia, tolerancia_passo):
+    """Pontua as candidatas dentro de `tolerancia_passo` (BPM, chave e bônus de curva)."""
+    candidatas_avaliadas = []
+    for _, candidata_row in candidatas.iterrows():
+        if abs(musica_anterior['bpm'] - candidata_row['bpm']) <= tolerancia_passo:
+            info_candidata = calculate_final_score(musica_anterior, candidata_row.to_dict(), pesos, bpm_tolerancia)
+            bonus = calculate_energy_curve_bonus(info_candidata['musica']['vibe'], segmento_alvo)
+            info_candidata['score_final'] += bonus
+            candidatas_avaliadas.append(info_candidata)
+    return candidatas_avaliadas
+
+def criar_dj_set(biblioteca, tamanho_set, curva_energia_str, musica_inicial_nome=None, bpm_tolerancia=8, pesos={'bpm': 0.6, 'key': 0.4}, restricoes=None):
   """Gera um DJ set estratégico que tenta seguir uma curva de energia (vibe).
 
     Esta versão do algoritmo funciona como um "diretor de cena". Ela divide o set
@@ -302,6 +478,9 @@ def criar_dj_set(biblioteca, tamanho_set, curva_energia_str, musica_inicial_nome
                                         ser considerada. Defaults to 8.
         pesos (dict, optional): Dicionário com os pesos para 'bpm' e 'key' no
                                 cálculo do score. Defaults to {'bpm': 0.6, 'key': 0.4}.
+        restricoes (dict, optional): Restrições de artista, faixas e drift de BPM no
+                                     formato de `DEFAULT_RESTRICOES` (veja
+                                     `ControleRestricoes`). Defaults to None.
 
     Returns:
         pd.DataFrame: Um DataFrame contendo o set gerado, com colunas detalhadas
@@ -315,6 +494,14 @@ def criar_dj_set(biblioteca, tamanho_set, curva_energia_str, musica_inicial_nome
   # 1. PREPARAÇÃO
   biblioteca_com_vibe = calcular_vibe(biblioteca, pesos=pesos)
   setlist = []
+  controle = None
+  if restricoes:
+      # '_pos' liga cada linha às posições usadas pelos contadores do ControleRestricoes
+      biblioteca_com_vibe = biblioteca_com_vibe.reset_index(drop=True)
+      biblioteca_com_vibe['_pos'] = np.arange(len(biblioteca_com_vibe))
+      controle = ControleRestricoes.de_biblioteca(biblioteca_com_vibe, restricoes)
+      permitidas = controle.permitida(biblioteca_com_vibe['_pos'].to_numpy())
+      biblioteca_com_vibe = biblioteca_com_vibe[permitidas]  # Remove as proibidas
   musicas_disponiveis = biblioteca_com_vibe.copy().set_index('title', drop=False)
   curva_energia_lista = curva_energia_str.split('-')
   # Previne divisão por zero se a curva for vazia
@@ -342,19 +529,36 @@ def criar_dj_set(biblioteca, tamanho_set, curva_energia_str, musica_inicial_nome
   musica_atual_dict['transition_score'] = 1.0
   setlist.append(musica_atual_dict)
   musicas_disponiveis = musicas_disponiveis.drop(musica_atual_row.name)
+  if controle:
+      controle.obrigatorias_pendentes.discard(musica_atual_dict['title'])
+      controle.iniciar_passo(0, 0)
+      controle.registrar(musica_atual_dict['_pos'], 0, 0)
   # 3. LOOP PRINCIPAL DE GERAÇÃO
   while len(setlist) < tamanho_set and not musicas_disponiveis.empty:
       musica_anterior = setlist[-1]
       posicao_atual = len(setlist)
       indice_segmento = min(posicao_atual // tamanho_segmento, len(curva_energia_lista) - 1)
       segmento_alvo = curva_energia_lista[indice_segmento]
+      candidatas = musicas_disponiveis
       candidatas_avaliadas = []
-      for _, candidata_row in musicas_disponiveis.iterrows():
-          if abs(musica_anterior['bpm'] - candidata_row['bpm']) <= bpm_tolerancia:
-              info_candidata = calculate_final_score(musica_anterior, candidata_row.to_dict(), pesos, bpm_tolerancia)
-              bonus = calculate_energy_curve_bonus(info_candidata['musica']['vibe'], segmento_alvo)
-              info_candidata['score_final'] += bonus
-              candidatas_avaliadas.append(info_candidata)
+      forcar_obrigatorias = False
+      if controle:
+          controle.iniciar_passo(posicao_atual, indice_segmento)
+          candidatas = musicas_disponiveis[controle.permitida(musicas_disponiveis['_pos'].to_numpy())]
+          if controle.obrigatorias_pendentes:
+              # Obrigatórias pendentes que passam nas regras e na tolerância têm prioridade
+              prioritarias = candidatas[candidatas.index.isin(controle.obrigatorias_pendentes)]
+              candidatas_avaliadas = _avaliar_candidatas(musica_anterior, prioritarias, segmento_alvo, pesos, bpm_tolerancia, bpm_tolerancia)
+              forcar_obrigatorias = len(controle.obrigatorias_pendentes) >= tamanho_set - posicao_atual
+      if not candidatas_avaliadas and not forcar_obrigatorias:
+          candidatas_avaliadas = _avaliar_candidatas(musica_anterior, candidatas, segmento_alvo, pesos, bpm_tolerancia, bpm_tolerancia)
+      if not candidatas_avaliadas and controle and controle.obrigatorias_pendentes:
+          # Último recurso (só restam as vagas das obrigatórias ou nada passa nas regras):
+          # as obrigatórias entram ignorando as regras e a tolerância de BPM
+          if not forcar_obrigatorias:
+              print("Aviso: nenhuma candidata passa nas restrições; usando as músicas obrigatórias pendentes.")
+          candidatas = musicas_disponiveis[musicas_disponiveis.index.isin(controle.obrigatorias_pendentes)]
+          candidatas_avaliadas = _avaliar_candidatas(musica_anterior, candidatas, segmento_alvo, pesos, bpm_tolerancia, float('inf'))
 
       if not candidatas_avaliadas:
           print(f"Não encontrei nenhuma música compatível para continuar o set após '{musica_anterior['title']}'. Parando.")
@@ -369,6 +573,11 @@ def criar_dj_set(biblioteca, tamanho_set, curva_energia_str, musica_inicial_nome
       proxima_musica_dict['transition_score'] = melhor_candidata_info['score_final'] 
       setlist.append(proxima_musica_dict)
       musicas_disponiveis = musicas_disponiveis.drop(proxima_musica_dict['title'])
+      if controle:
+          controle.obrigatorias_pendentes.discard(proxima_musica_dict['title'])
+          controle.registrar(proxima_musica_dict['_pos'], posicao_atual, indice_segmento)
+  if controle and controle.obrigatorias_pendentes:
+      print(f"Aviso: músicas obrigatórias que não entraram no set: {sorted(controle.obrigatorias_pendentes)}")
   # Colunas finais do DataFrame do set
   colunas_finais = ['title', 'artist', 'bpm', 'key', 'localização', 'vibe', 'transition_name', 'transition_effect', 'transition_icon', 'transition_score']
   df_set = pd.DataFrame(setlist)
@@ -380,11 +589,88 @@ def criar_dj_set(biblioteca, tamanho_set, curva_energia_str, musica_inicial_nome
   return df_set[colunas_finais]
 
 
-def plotar_curva_de_vibe(df_set):
+def calcular_hash_set(df_set):
+    """Calcula um hash estável do conteúdo de um set (colunas e valores).
+
+    Args:
+        df_set (pd.DataFrame): O DataFrame do set gerado.
+
+    Returns:
+        str: O hash hexadecimal do conteúdo do set.
+    """
+    hasher = hashlib.sha1()
+    hasher.update('|'.join(map(str, df_set.columns)).encode('utf-8'))
+    hasher.update(pd.util.hash_pandas_object(df_set, index=False).values.tobytes())
+    return hasher.hexdigest()
+
+def _obter_figura_em_cache(chave, construir_figura):
+    """Retorna a figura do cache para `chave` ou a constrói e armazena (LRU)."""
+    with _lock_cache_figuras:
+        fig = _cache_figuras.get(chave)
+        if fig is not None:
+            _cache_figuras.move_to_end(chave)
+            return fig
+    # A construção fica fora do lock para não serializar sessões com sets diferentes
+    fig = construir_figura()
+    with _lock_cache_figuras:
+        fig = _cache_figuras.setdefault(chave, fig)
+        _cache_figuras.move_to_end(chave)
+        if len(_cache_figuras) > MAX_FIGURAS_EM_CACHE:
+            _cache_figuras.popitem(last=False)
+    return fig
+
+def _montar_hover_text(df_plot):
+    """Monta o texto do hover de cada música com operações vetorizadas.
+
+    Args:
+        df_plot (pd.DataFrame): O DataFrame do set com as colunas 'title', 'artist',
+                                'bpm', 'key', 'vibe', 'transition_name' e 'transition_icon'.
+
+    Returns:
+        pd.Series: Uma série de strings HTML, uma por música.
+    """
+    bpm_txt = pd.Series(np.char.mod('%.0f', df_plot['bpm'].to_numpy(dtype=float)), index=df_plot.index)
+    vibe_txt = pd.Series(np.char.mod('%.2f', df_plot['vibe'].to_numpy(dtype=float)), index=df_plot.index)
+    return (
+        "<b>" + df_plot['title'].astype(str) + "</b><br>" +
+        "Artista: " + df_plot['artist'].astype(str) + "<br>" +
+        "BPM: " + bpm_txt + " | Chave: " + df_plot['key'].astype(str) + "<br>" +
+        "Vibe: " + vibe_txt + "<br>" +
+        "Transição: " + df_plot['transition_name'].astype(str) + " (" + df_plot['transition_icon'].astype(str) + ")"
+    )
+
+def _segmentos_da_curva(curva_energia_str, tamanho_set):
+    """Divide as posições do set (1..tamanho_set) nos segmentos da curva.
+
+    Usa a mesma regra de `criar_dj_set`: cada segmento ocupa `tamanho_set // n`
+    posições e o último absorve o restante.
+
+    Returns:
+        list[tuple[str, int, int]]: Lista de (segmento, posição_inicial, posição_final).
+    """
+    curva_energia_lista = [seg for seg in curva_energia_str.split('-') if seg]
+    if not curva_energia_lista or tamanho_set < 1:
+        return []
+    tamanho_segmento = max(1, tamanho_set // len(curva_energia_lista))
+    segmentos = []
+    for indice, segmento in enumerate(curva_energia_lista):
+        inicio = indice * tamanho_segmento + 1
+        if inicio > tamanho_set:
+            break
+        fim = tamanho_set if indice == len(curva_energia_lista) - 1 else min(tamanho_set, inicio + tamanho_segmento - 1)
+        segmentos.append((segmento, inicio, fim))
+    return segmentos
+
+def plotar_curva_de_vibe(df_set, titulo='<b>Curva de Vibe do Set Gerado</b>'):
     """Gera um gráfico interativo da curva de vibe de um set.
 
+    A figura é guardada em cache pelo hash do conteúdo do set, então reruns do
+    Streamlit com o mesmo set reutilizam a figura já construída. Por isso a
+    figura retornada não deve ser modificada; use `titulo` para personalizá-la.
+
     Args:
         df_set (pd.DataFrame): O DataFrame do set gerado.
+        titulo (str, optional): O título do gráfico.
 
     Returns:
         plotly.graph_objects.Figure: O objeto da figura do Plotly, pronto para ser renderizado.
@@ -395,46 +681,123 @@ def plotar_curva_de_vibe(df_set):
         # Retorna uma figura vazia para não quebrar a aplicação
         return px.line(title="Gere um set para ver a curva de vibe")
 
-    # 1. Prepara os dados (esta parte muda um pouco)
-    # Adicionamos uma coluna de "Posição" ao DataFrame para usar como eixo X.
-    df_plot = df_set.copy()
-    df_plot['Posição'] = range(1, len(df_plot) + 1)
-    
-    # Criamos o texto do hover (mesma lógica de antes)
-    df_plot['hover_text'] = [
-        f"<b>{row['title']}</b><br>" +
-        f"Artista: {row['artist']}<br>" +
-        f"BPM: {row['bpm']:.0f} | Chave: {row['key']}<br>" +
-        f"Vibe: {row['vibe']:.2f}<br>" +
-        f"Transição: {row['transition_name']} ({row['transition_icon']})"
-        for index, row in df_plot.iterrows()
-    ]
-
-    # 2. CRIA O GRÁFICO COM UMA ÚNICA LINHA DE CÓDIGO!
-    fig = px.line(
-        df_plot,
-        x='Posição',
-        y='vibe',
-        title='<b>Curva de Vibe do Set Gerado</b>',
-        markers=True, # Adiciona os pontos/marcadores na linha
-        hover_data={'Posição': False, 'vibe': ':.2f', 'hover_text': True} # Define o que aparece no hover
-    )
+    def construir_figura():
+        # 1. Prepara os dados: a posição no set é o eixo X e o hover é montado de forma vetorizada.
+        posicoes = np.arange(1, len(df_set) + 1)
+        hover_text = _montar_hover_text(df_set)
+
+        # 2. Cria o gráfico direto com graph_objects (mais leve que o plotly.express)
+        fig = go.Figure(go.Scatter(
+            x=posicoes,
+            y=df_set['vibe'].to_numpy(),
+            mode='lines+markers',
+            hovertext=hover_text.to_numpy(),
+            hovertemplate='%{hovertext}<extra></extra>'
+        ))
+
+        # 3. Configura o layout
+        fig.update_layout(
+            xaxis_title='Posição da Música no Set',
+            yaxis_title='Nível de Vibe (0.0 a 1.0)',
+            xaxis=dict(tickmode='linear', dtick=1),
+            yaxis=dict(range=[0, 1]),
+            template='plotly_white',
+            height=500,
+            title={'text': titulo, 'y':0.9, 'x':0.5, 'xanchor': 'center', 'yanchor': 'top', 'font': {'size': 20}}
+        )
+        return fig
+
+    chave = ('curva', calcular_hash_set(df_set), titulo)
+    return _obter_figura_em_cache(chave, construir_figura)
+
+def plotar_sobreposicao_de_sets(sets, curva_energia_str=None, nomes=None, titulo='<b>Comparação de Curvas de Vibe</b>'):
+    """Sobrepõe as curvas de vibe de vários sets em um único gráfico WebGL.
+
+    Cada set vira um traço `Scattergl` e, ao fundo, são desenhadas as faixas de
+    `VIBE_SEGMENTS`: se `curva_energia_str` for informada, cada faixa cobre apenas
+    as posições do seu segmento (a curva alvo); caso contrário, as faixas cobrem
+    o eixo X inteiro. A figura é guardada em cache pelo hash de todos os sets.
+
+    Args:
+        sets (list[pd.DataFrame]): Os DataFrames dos sets gerados.
+        curva_energia_str (str, optional): A curva alvo usada na geração
+                                           (ex: "mid-up-up-down"). Defaults to None.
+        nomes (list[str], optional): Nomes exibidos na legenda, um por set.
+                                     Defaults to "Set 1", "Set 2", ...
+        titulo (str, optional): O título do gráfico.
 
-    # Personaliza o template do hover para usar nosso texto customizado
-    fig.update_traces(hovertemplate='%{customdata[0]}<extra></extra>', customdata=df_plot[['hover_text']])
-
-    # 3. Configura o layout (muito similar a antes)
-    fig.update_layout(
-        xaxis_title='Posição da Música no Set',
-        yaxis_title='Nível de Vibe (0.0 a 1.0)',
-        xaxis=dict(tickmode='linear', dtick=1),
-        yaxis=dict(range=[0, 1]),
-        template='plotly_white',
-        height=500,
-        title={'y':0.9, 'x':0.5, 'xanchor': 'center', 'yanchor': 'top', 'font': {'size': 20}}
+    Returns:
+        plotly.graph_objects.Figure: O objeto da figura do Plotly, pronto para ser renderizado.
+
+    Raises:
+        ValueError: Se `nomes` não tiver um nome para cada set.
+    """
+    if nomes is not None and len(nomes) != len(sets):
+        raise ValueError(f"'nomes' deve ter um nome para cada set ({len(nomes)} nomes para {len(sets)} sets).")
+    sets_validos = [(i, df) for i, df in enumerate(sets) if not df.empty and 'vibe' in df.columns]
+    if not sets_validos:
+        print("Nenhum set válido para sobrepor. Gráfico não pode ser gerado.")
+        return px.line(title="Gere sets para comparar as curvas de vibe")
+    if nomes is None:
+        nomes = [f"Set {i + 1}" for i in range(len(sets))]
+
+    def construir_figura():
+        # 1. Concatena todos os sets para montar o hover uma única vez (vetorizado)
+        df_todos = pd.concat([df for _, df in sets_validos], ignore_index=True)
+        hover_text = _montar_hover_text(df_todos).to_numpy()
+        vibes = df_todos['vibe'].to_numpy()
+        tamanho_max = max(len(df) for _, df in sets_validos)
+
+        # 2. Um traço Scattergl (WebGL) por set, fatiando os arrays concatenados
+        traces = []
+        inicio = 0
+        for i, df in sets_validos:
+            fim = inicio + len(df)
+            traces.append(go.Scattergl(
+                x=np.arange(1, len(df) + 1),
+                y=vibes[inicio:fim],
+                mode='lines+markers',
+                name=nomes[i],
+                hovertext=hover_text[inicio:fim],
+                hovertemplate='<i>%{fullData.name}</i><br>%{hovertext}<extra></extra>'
+            ))
+            inicio = fim
+
+        # 3. Faixas de vibe alvo como shapes de fundo
+        if curva_energia_str:
+            faixas = [(seg, ini - 0.5, fim + 0.5) for seg, ini, fim in _segmentos_da_curva(curva_energia_str, tamanho_max)]
+        else:
+            faixas = [(seg, 0.5, tamanho_max + 0.5) for seg in VIBE_SEGMENTS]
+        shapes = []
+        for segmento, x0, x1 in faixas:
+            min_vibe, max_vibe = get_target_vibe_range(segmento)
+            shapes.append(dict(
+                type='rect', xref='x', yref='y', x0=x0, x1=x1, y0=min_vibe, y1=max_vibe,
+                fillcolor=CORES_SEGMENTOS.get(segmento, 'rgba(128, 128, 128, 0.12)'),
+                line={'width': 0}, layer='below'
+            ))
+
+        fig = go.Figure(data=traces)
+        fig.update_layout(
+            shapes=shapes,
+            xaxis_title='Posição da Música no Set',
+            yaxis_title='Nível de Vibe (0.0 a 1.0)',
+            xaxis=dict(range=[0.5, tamanho_max + 0.5]),
+            yaxis=dict(range=[0, 1]),
+            template='plotly_white',
+            height=500,
+            title={'text': titulo, 'y':0.9, 'x':0.5, 'xanchor': 'center', 'yanchor': 'top', 'font': {'size': 20}}
+        )
+        return fig
+
+    chave = (
+        'sobreposicao',
+        tuple(calcular_hash_set(df) for _, df in sets_validos),
+        tuple(nomes[i] for i, _ in sets_validos),
+        curva_energia_str,
+        titulo
     )
-    
-    return fig
+    return _obter_figura_em_cache(chave, construir_figura)
 
 def exportar_set_csv(df_set):
     """